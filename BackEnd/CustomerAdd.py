@@ -1,14 +1,17 @@
 from fastapi import APIRouter, HTTPException, Depends
 from models.customer import CustomerCreate, Customer
-from database import customers_collection
+from database import customers_collection, get_shop_id
+from query_limits import raise_if_timeout
+from routes.dashboard.Dashboard import invalidate_dashboard_cache
 from datetime import datetime
 from bson import ObjectId
 
 router = APIRouter()
 
 @router.post("/", response_model=Customer)
-async def create_customer(customer: CustomerCreate):
+async def create_customer(customer: CustomerCreate, shop_id: str = Depends(get_shop_id)):
     customer_dict = customer.dict()
+    customer_dict["shopId"] = shop_id
     customer_dict["createdAt"] = datetime.utcnow()
     customer_dict["totalLoans"] = 0
     customer_dict["unpaidLoans"] = 0
@@ -17,6 +20,8 @@ async def create_customer(customer: CustomerCreate):
     try:
         result = await customers_collection.insert_one(customer_dict)
         customer_dict["_id"] = result.inserted_id
+        await invalidate_dashboard_cache(shop_id)
         return Customer(**customer_dict)
     except Exception as e:
+        raise_if_timeout(e)
         raise HTTPException(status_code=500, detail=f"Failed to create customer: {str(e)}")
\ No newline at end of file
@@ -1,24 +1,30 @@
 from fastapi import APIRouter, HTTPException, Depends
 from models.customer import Customer, CustomerUpdate
 from models.loan import Loan, LoanCreate, LoanUpdate
-from database import customers_collection, loans_collection
+from database import customers_collection, loans_collection, get_shop_id
+from query_limits import raise_if_timeout
+from routes.dashboard.Dashboard import invalidate_dashboard_cache
+from accrual import customer_accrued_fees
 from bson import ObjectId
+from pymongo import ReturnDocument
 from typing import List
 from datetime import datetime
 
 router = APIRouter()
 
 @router.get("/{id}", response_model=Customer)
-async def get_customer(id: str):
+async def get_customer(id: str, shop_id: str = Depends(get_shop_id)):
     if not ObjectId.is_valid(id):
         raise HTTPException(status_code=400, detail="Invalid customer ID")
-    customer = await customers_collection.find_one({"_id": ObjectId(id)})
+    customer = await customers_collection.find_one({"_id": ObjectId(id), "shopId": shop_id})
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
+    fees = await customer_accrued_fees(shop_id, [customer["_id"]])
+    customer["accruedFees"] = fees.get(customer["_id"], 0)
     return Customer(**customer)
 
 @router.put("/{id}", response_model=Customer)
-async def update_customer(id: str, customer_update: CustomerUpdate):
+async def update_customer(id: str, customer_update: CustomerUpdate, shop_id: str = Depends(get_shop_id)):
     if not ObjectId.is_valid(id):
         raise HTTPException(status_code=400, detail="Invalid customer ID")
     update_data = {k: v for k, v in customer_update.dict(exclude_unset=True).items()}
@@ -26,22 +32,25 @@ async def update_customer(id: str, customer_update: CustomerUpdate):
         raise HTTPException(status_code=400, detail="No data provided to update")
     
     result = await customers_collection.update_one(
-        {"_id": ObjectId(id)},
+        {"_id": ObjectId(id), "shopId": shop_id},
         {"$set": update_data}
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Customer not found")
     
-    updated_customer = await customers_collection.find_one({"_id": ObjectId(id)})
+    updated_customer = await customers_collection.find_one({"_id": ObjectId(id), "shopId": shop_id})
+    fees = await customer_accrued_fees(shop_id, [updated_customer["_id"]])
+    updated_customer["accruedFees"] = fees.get(updated_customer["_id"], 0)
     return Customer(**updated_customer)
 
 @router.delete("/{id}")
-async def delete_customer(id: str):
+async def delete_customer(id: str, shop_id: str = Depends(get_shop_id)):
     if not ObjectId.is_valid(id):
         raise HTTPException(status_code=400, detail="Invalid customer ID")
     
     # Check if customer has unpaid loans
     unpaid_loans = await loans_collection.count_documents({
+        "shopId": shop_id,
         "customerId": ObjectId(id),
         "status": "unpaid"
     })
@@ -49,33 +58,35 @@ async def delete_customer(id: str):
         raise HTTPException(status_code=400, detail="Cannot delete customer with unpaid loans")
     
     # Delete loans
-    await loans_collection.delete_many({"customerId": ObjectId(id)})
+    await loans_collection.delete_many({"shopId": shop_id, "customerId": ObjectId(id)})
     
     # Delete customer
-    result = await customers_collection.delete_one({"_id": ObjectId(id)})
+    result = await customers_collection.delete_one({"_id": ObjectId(id), "shopId": shop_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Customer not found")
+    await invalidate_dashboard_cache(shop_id)
     
     return {"message": "Customer deleted successfully"}
 
 @router.get("/{id}/loans", response_model=List[Loan])
-async def get_customer_loans(id: str):
+async def get_customer_loans(id: str, shop_id: str = Depends(get_shop_id)):
     if not ObjectId.is_valid(id):
         raise HTTPException(status_code=400, detail="Invalid customer ID")
-    loans = await loans_collection.find({"customerId": ObjectId(id)}).to_list(None)
+    loans = await loans_collection.find({"shopId": shop_id, "customerId": ObjectId(id)}).to_list(None)
     return [Loan(**loan) for loan in loans]
 
 @router.post("/{id}/loans", response_model=Loan)
-async def create_loan(id: str, loan: LoanCreate):
+async def create_loan(id: str, loan: LoanCreate, shop_id: str = Depends(get_shop_id)):
     if not ObjectId.is_valid(id):
         raise HTTPException(status_code=400, detail="Invalid customer ID")
     
-    customer = await customers_collection.find_one({"_id": ObjectId(id)})
+    customer = await customers_collection.find_one({"_id": ObjectId(id), "shopId": shop_id})
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
     loan_dict = loan.dict()
     loan_dict["customerId"] = ObjectId(id)
+    loan_dict["shopId"] = shop_id
     
     try:
         result = await loans_collection.insert_one(loan_dict)
@@ -83,23 +94,25 @@ async def create_loan(id: str, loan: LoanCreate):
         
         # Update customer loan stats
         await customers_collection.update_one(
-            {"_id": ObjectId(id)},
+            {"_id": ObjectId(id), "shopId": shop_id},
             {
                 "$inc": {"totalLoans": 1, "unpaidLoans": 1},
                 "$set": {"lastLoanDate": loan_dict["loanDate"]}
             }
         )
+        await invalidate_dashboard_cache(shop_id)
         
         return Loan(**loan_dict)
     except Exception as e:
+        raise_if_timeout(e)
         raise HTTPException(status_code=500, detail=f"Failed to create loan: {str(e)}")
 
 @router.put("/{id}/loans/{loan_id}/mark-paid", response_model=Loan)
-async def mark_loan_as_paid(id: str, loan_id: str):
+async def mark_loan_as_paid(id: str, loan_id: str, shop_id: str = Depends(get_shop_id)):
     if not ObjectId.is_valid(id) or not ObjectId.is_valid(loan_id):
         raise HTTPException(status_code=400, detail="Invalid ID")
     
-    loan = await loans_collection.find_one({"_id": ObjectId(loan_id), "customerId": ObjectId(id)})
+    loan = await loans_collection.find_one({"_id": ObjectId(loan_id), "shopId": shop_id, "customerId": ObjectId(id)})
     if not loan:
         raise HTTPException(status_code=404, detail="Loan not found")
     
@@ -108,22 +121,26 @@ async def mark_loan_as_paid(id: str, loan_id: str):
     
     update_data = {
         "status": "paid",
-        "paymentDate": datetime.utcnow().strftime("%Y-%m-%d")
+        "paymentDate": datetime.utcnow().strftime("%Y-%m-%d"),
+        # Settle the late fee as it stands at payment time, not as read above
+        "paidFee": {"$ifNull": ["$accruedFee", 0]},
+        "accruedFee": 0
     }
     
-    result = await loans_collection.update_one(
-        {"_id": ObjectId(loan_id)},
-        {"$set": update_data}
+    updated_loan = await loans_collection.find_one_and_update(
+        {"_id": ObjectId(loan_id), "shopId": shop_id, "status": "unpaid"},
+        [{"$set": update_data}],
+        return_document=ReturnDocument.AFTER
     )
     
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Loan not found")
+    if not updated_loan:
+        raise HTTPException(status_code=400, detail="Loan already paid")
     
     # Update customer unpaid loans count
     await customers_collection.update_one(
-        {"_id": ObjectId(id)},
+        {"_id": ObjectId(id), "shopId": shop_id},
         {"$inc": {"unpaidLoans": -1}}
     )
+    await invalidate_dashboard_cache(shop_id)
     
-    updated_loan = await loans_collection.find_one({"_id": ObjectId(loan_id)})
     return Loan(**updated_loan)
\ No newline at end of file
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Depends
 from fastapi.responses import Response
 from models.customer import Customer
-from database import customers_collection
+from database import customers_collection, get_shop_id
+from query_limits import raise_if_timeout
+from accrual import customer_accrued_fees
 from typing import List, Optional
 from bson import ObjectId
 from datetime import datetime
@@ -10,16 +12,16 @@ import io
 
 router = APIRouter()
 
-@router.get("/", response_model=List[Customer])
-async def list_customers(
-    search: Optional[str] = Query(None),
-    show_unpaid_only: Optional[bool] = Query(False),
-    start_date: Optional[str] = Query(None),
-    end_date: Optional[str] = Query(None),
-    page: int = Query(1, ge=1),
-    limit: int = Query(10, ge=1, le=100)
-):
-    query = {}
+CSV_HEADERS = ["ID", "Name", "Mobile Number", "Address", "Created At", "Total Loans", "Unpaid Loans", "Last Loan Date"]
+
+def build_customer_query(
+    shop_id: str,
+    search: Optional[str] = None,
+    show_unpaid_only: Optional[bool] = False,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+) -> dict:
+    query = {"shopId": shop_id}
     
     if search:
         query["$or"] = [
@@ -39,11 +41,39 @@ async def list_customers(
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
     
+    return query
+
+def customer_csv_row(customer: dict) -> list:
+    return [
+        str(customer["_id"]),
+        customer["name"],
+        customer["mobileNumber"],
+        customer["address"],
+        customer["createdAt"].strftime("%Y-%m-%d"),
+        customer["totalLoans"],
+        customer["unpaidLoans"],
+        customer.get("lastLoanDate", "")
+    ]
+
+@router.get("/", response_model=List[Customer])
+async def list_customers(
+    search: Optional[str] = Query(None),
+    show_unpaid_only: Optional[bool] = Query(False),
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None),
+    page: int = Query(1, ge=1),
+    limit: int = Query(10, ge=1, le=100),
+    shop_id: str = Depends(get_shop_id)
+):
+    query = build_customer_query(shop_id, search, show_unpaid_only, start_date, end_date)
+    
     try:
         skip = (page - 1) * limit
         customers = await customers_collection.find(query).skip(skip).limit(limit).to_list(None)
-        return [Customer(**customer) for customer in customers]
+        fees = await customer_accrued_fees(shop_id, [customer["_id"] for customer in customers])
+        return [Customer(**{**customer, "accruedFees": fees.get(customer["_id"], 0)}) for customer in customers]
     except Exception as e:
+        raise_if_timeout(e)
         raise HTTPException(status_code=500, detail=f"Failed to fetch customers: {str(e)}")
 
 @router.get("/export/csv")
@@ -51,27 +81,10 @@ async def export_customers_csv(
     search: Optional[str] = Query(None),
     show_unpaid_only: Optional[bool] = Query(False),
     start_date: Optional[str] = Query(None),
-    end_date: Optional[str] = Query(None)
+    end_date: Optional[str] = Query(None),
+    shop_id: str = Depends(get_shop_id)
 ):
-    query = {}
-    
-    if search:
-        query["$or"] = [
-            {"name": {"$regex": search, "$options": "i"}},
-            {"mobileNumber": {"$regex": search, "$options": "i"}},
-            {"address": {"$regex": search, "$options": "i"}}
-        ]
-    
-    if show_unpaid_only:
-        query["unpaidLoans"] = {"$gt": 0}
-    
-    if start_date and end_date:
-        try:
-            start = datetime.strptime(start_date, "%Y-%m-%d")
-            end = datetime.strptime(end_date, "%Y-%m-%d")
-            query["createdAt"] = {"$gte": start, "$lte": end}
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    query = build_customer_query(shop_id, search, show_unpaid_only, start_date, end_date)
     
     try:
         customers = await customers_collection.find(query).to_list(None)
@@ -79,20 +92,11 @@ async def export_customers_csv(
         writer = csv.writer(output)
         
         # Write CSV headers
-        writer.writerow(["ID", "Name", "Mobile Number", "Address", "Created At", "Total Loans", "Unpaid Loans", "Last Loan Date"])
+        writer.writerow(CSV_HEADERS)
         
         # Write customer data
         for customer in customers:
-            writer.writerow([
-                str(customer["_id"]),
-                customer["name"],
-                customer["mobileNumber"],
-                customer["address"],
-                customer["createdAt"].strftime("%Y-%m-%d"),
-                customer["totalLoans"],
-                customer["unpaidLoans"],
-                customer.get("lastLoanDate", "")
-            ])
+            writer.writerow(customer_csv_row(customer))
         
         return Response(
             content=output.getvalue(),
@@ -100,4 +104,5 @@ async def export_customers_csv(
             headers={"Content-Disposition": 'attachment; filename="customers.csv"'}
         )
     except Exception as e:
+        raise_if_timeout(e)
         raise HTTPException(status_code=500, detail=f"Failed to export customers: {str(e)}")
\ No newline at end of file
@@ -1,12 +1,23 @@
-from fastapi import APIRouter, HTTPException, Query
-from database import customers_collection, loans_collection
+from fastapi import APIRouter, HTTPException, Query, Depends
+from database import customers_collection, loans_collection, dashboard_generations_collection, get_shop_id
+from query_limits import raise_if_timeout
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, Dict, Optional, Tuple
 from pydantic import BaseModel
 from bson import ObjectId
+import asyncio
+import os
 
 router = APIRouter()
 
+DASHBOARD_CACHE_SECONDS = int(os.getenv("DASHBOARD_CACHE_SECONDS", "60"))
+DASHBOARD_CACHE_MAX_ENTRIES = int(os.getenv("DASHBOARD_CACHE_MAX_ENTRIES", "1000"))
+
+# Per-process cache: (shopId, start date, end date) -> (expiry, generation, dashboard data).
+# Each shop's generation is kept in Mongo and bumped by every write, so an entry is only
+# served while no worker has changed that shop's data since it was computed
+dashboard_cache: Dict[Tuple[str, str, str], Tuple[datetime, int, dict]] = {}
+
 class DashboardStats(BaseModel):
     totalCustomers: int
     totalLoans: int
@@ -22,101 +33,150 @@ class DashboardResponse(BaseModel):
     stats: DashboardStats
     chartData: list[ChartDataPoint]
 
+def parse_date_range(start_date: Optional[str], end_date: Optional[str]):
+    # Parse date range or default to last 6 months
+    if start_date and end_date:
+        try:
+            start = datetime.strptime(start_date, "%Y-%m-%d")
+            end = datetime.strptime(end_date, "%Y-%m-%d")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    else:
+        end = datetime.utcnow()
+        start = end - timedelta(days=180)  # 6 months
+    return start, end
+
+async def invalidate_dashboard_cache(shop_id: str):
+    await dashboard_generations_collection.update_one(
+        {"_id": shop_id}, {"$inc": {"generation": 1}}, upsert=True
+    )
+
+async def dashboard_generation(shop_id: str) -> int:
+    doc = await dashboard_generations_collection.find_one({"_id": shop_id})
+    return doc["generation"] if doc else 0
+
+def month_buckets(start: datetime, end: datetime) -> list:
+    # The first bucket starts at the range start, later ones cover whole months
+    buckets = []
+    current_date = start
+    while current_date <= end:
+        month_end = (current_date.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        buckets.append((current_date.strftime("%Y-%m"), current_date.strftime("%b"), month_end))
+        current_date = month_end + timedelta(days=1)
+    return buckets
+
+async def sum_amount(match: dict) -> float:
+    result = await loans_collection.aggregate([
+        {"$match": match},
+        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
+    ]).to_list(1)
+    return result[0]["total"] if result else 0
+
+async def monthly_rollup(match: dict, date_field: str) -> dict:
+    # Sums amounts per YYYY-MM month of date_field in a single pass
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": {"$substrBytes": [f"${date_field}", 0, 7]}, "total": {"$sum": "$amount"}}}
+    ]
+    return {row["_id"]: row["total"] async for row in loans_collection.aggregate(pipeline)}
+
+async def build_dashboard_data(
+    shop_id: str,
+    start: datetime,
+    end: datetime,
+    on_progress: Optional[Callable[[int, int], None]] = None
+) -> dict:
+    start_str = start.strftime("%Y-%m-%d")
+    end_str = end.strftime("%Y-%m-%d")
+
+    # Calculate stats and aggregate unpaid and paid amounts
+    customer_count, loan_count, total_unpaid, total_paid = await asyncio.gather(
+        customers_collection.count_documents({"shopId": shop_id}),
+        loans_collection.count_documents({
+            "shopId": shop_id,
+            "loanDate": {"$gte": start_str, "$lte": end_str}
+        }),
+        sum_amount({
+            "shopId": shop_id,
+            "status": "unpaid",
+            "loanDate": {"$gte": start_str, "$lte": end_str}
+        }),
+        sum_amount({
+            "shopId": shop_id,
+            "status": "paid",
+            "paymentDate": {"$gte": start_str, "$lte": end_str}
+        })
+    )
+    if on_progress:
+        on_progress(1, 2)
+
+    # Generate chart data (monthly aggregation)
+    buckets = month_buckets(start, end)
+    chart_data = []
+    if buckets:
+        chart_end_str = buckets[-1][2].strftime("%Y-%m-%d")
+        loans_by_month, collections_by_month = await asyncio.gather(
+            monthly_rollup({
+                "shopId": shop_id,
+                "loanDate": {"$gte": start_str, "$lte": chart_end_str}
+            }, "loanDate"),
+            monthly_rollup({
+                "shopId": shop_id,
+                "status": "paid",
+                "paymentDate": {"$gte": start_str, "$lte": chart_end_str}
+            }, "paymentDate")
+        )
+        chart_data = [
+            {
+                "name": month_name,
+                "loans": loans_by_month.get(month_key, 0),
+                "collections": collections_by_month.get(month_key, 0)
+            }
+            for month_key, month_name, _ in buckets
+        ]
+    if on_progress:
+        on_progress(2, 2)
+
+    return {
+        "stats": {
+            "totalCustomers": customer_count,
+            "totalLoans": loan_count,
+            "totalUnpaidAmount": total_unpaid,
+            "totalPaidAmount": total_paid
+        },
+        "chartData": chart_data
+    }
+
+async def get_cached_dashboard_data(shop_id: str, start: datetime, end: datetime) -> dict:
+    key = (shop_id, start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))
+    generation = await dashboard_generation(shop_id)
+    cached = dashboard_cache.get(key)
+    if cached and cached[0] > datetime.utcnow() and cached[1] == generation:
+        return cached[2]
+
+    data = await build_dashboard_data(shop_id, start, end)
+    # Skip the store if a write landed while the dashboard was being computed
+    if await dashboard_generation(shop_id) != generation:
+        return data
+
+    now = datetime.utcnow()
+    if len(dashboard_cache) >= DASHBOARD_CACHE_MAX_ENTRIES:
+        for expired_key in [k for k, (expiry, _, _) in dashboard_cache.items() if expiry <= now]:
+            del dashboard_cache[expired_key]
+        if len(dashboard_cache) >= DASHBOARD_CACHE_MAX_ENTRIES:
+            del dashboard_cache[next(iter(dashboard_cache))]
+    dashboard_cache[key] = (now + timedelta(seconds=DASHBOARD_CACHE_SECONDS), generation, data)
+    return data
+
 @router.get("/", response_model=DashboardResponse)
 async def get_dashboard_data(
     start_date: Optional[str] = Query(None),
-    end_date: Optional[str] = Query(None)
+    end_date: Optional[str] = Query(None),
+    shop_id: str = Depends(get_shop_id)
 ):
+    start, end = parse_date_range(start_date, end_date)
     try:
-        # Parse date range or default to last 6 months
-        if start_date and end_date:
-            try:
-                start = datetime.strptime(start_date, "%Y-%m-%d")
-                end = datetime.strptime(end_date, "%Y-%m-%d")
-            except ValueError:
-                raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-        else:
-            end = datetime.utcnow()
-            start = end - timedelta(days=180)  # 6 months
-
-        # Calculate stats
-        customer_count = await customers_collection.count_documents({})
-        loan_count = await loans_collection.count_documents({
-            "loanDate": {"$gte": start.strftime("%Y-%m-%d"), "$lte": end.strftime("%Y-%m-%d")}
-        })
-        
-        # Aggregate unpaid and paid amounts
-        unpaid_pipeline = [
-            {"$match": {
-                "status": "unpaid",
-                "loanDate": {"$gte": start.strftime("%Y-%m-%d"), "$lte": end.strftime("%Y-%m-%d")}
-            }},
-            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-        ]
-        paid_pipeline = [
-            {"$match": {
-                "status": "paid",
-                "paymentDate": {"$gte": start.strftime("%Y-%m-%d"), "$lte": end.strftime("%Y-%m-%d")}
-            }},
-            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-        ]
-        
-        unpaid_result = await loans_collection.aggregate(unpaid_pipeline).to_list(1)
-        paid_result = await loans_collection.aggregate(paid_pipeline).to_list(1)
-        
-        total_unpaid = unpaid_result[0]["total"] if unpaid_result else 0
-        total_paid = paid_result[0]["total"] if paid_result else 0
-
-        # Generate chart data (monthly aggregation)
-        chart_data = []
-        current_date = start
-        while current_date <= end:
-            month_end = (current_date.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-            month_name = current_date.strftime("%b")
-            
-            # Aggregate loans for the month
-            loans_pipeline = [
-                {"$match": {
-                    "loanDate": {
-                        "$gte": current_date.strftime("%Y-%m-%d"),
-                        "$lte": month_end.strftime("%Y-%m-%d")
-                    }
-                }},
-                {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-            ]
-            collections_pipeline = [
-                {"$match": {
-                    "status": "paid",
-                    "paymentDate": {
-                        "$gte": current_date.strftime("%Y-%m-%d"),
-                        "$lte": month_end.strftime("%Y-%m-%d")
-                    }
-                }},
-                {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
-            ]
-            
-            loans_result = await loans_collection.aggregate(loans_pipeline).to_list(1)
-            collections_result = await loans_collection.aggregate(collections_pipeline).to_list(1)
-            
-            loans_amount = loans_result[0]["total"] if loans_result else 0
-            collections_amount = collections_result[0]["total"] if collections_result else 0
-            
-            chart_data.append({
-                "name": month_name,
-                "loans": loans_amount,
-                "collections": collections_amount
-            })
-            
-            current_date = month_end + timedelta(days=1)
-
-        return {
-            "stats": {
-                "totalCustomers": customer_count,
-                "totalLoans": loan_count,
-                "totalUnpaidAmount": total_unpaid,
-                "totalPaidAmount": total_paid
-            },
-            "chartData": chart_data
-        }
+        return await get_cached_dashboard_data(shop_id, start, end)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch dashboard data: {str(e)}")
\ No newline at end of file
+        raise_if_timeout(e)
+        raise HTTPException(status_code=500, detail=f"Failed to fetch dashboard data: {str(e)}")
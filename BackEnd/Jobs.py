@@ -0,0 +1,170 @@
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import FileResponse
+from pydantic import BaseModel, Field
+from database import customers_collection, get_shop_id
+from routes.customers.CustomerList import CSV_HEADERS, build_customer_query, customer_csv_row
+from routes.dashboard.Dashboard import build_dashboard_data, parse_date_range
+from query_limits import query_budget, JOBS
+from accrual import AccrualRules, accrue_late_fees
+from job_runner import job_runner, Job, JobQueueFull, JobAlreadyRunning, ACTIVE_STATES, COMPLETED
+from datetime import datetime
+from typing import Any, Dict, Literal, Optional
+import csv
+import json
+import os
+
+router = APIRouter()
+
+EXPORT_BATCH_SIZE = 1000
+
+class JobCreate(BaseModel):
+    type: Literal["customers_csv", "dashboard_report", "loan_accrual"]
+    params: Dict[str, Any] = {}
+
+class CustomersCsvParams(BaseModel):
+    search: Optional[str] = None
+    show_unpaid_only: bool = False
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+
+    class Config:
+        extra = "forbid"
+
+class DashboardReportParams(BaseModel):
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+
+    class Config:
+        extra = "forbid"
+
+class LoanAccrualParams(BaseModel):
+    accrual_date: Optional[str] = None
+    rules: AccrualRules = Field(default_factory=AccrualRules)
+
+    class Config:
+        extra = "forbid"
+
+class JobStatus(BaseModel):
+    id: str
+    shopId: str
+    type: str
+    status: str
+    processed: int
+    total: Optional[int] = None
+    error: Optional[str] = None
+    createdAt: datetime
+    startedAt: Optional[datetime] = None
+    finishedAt: Optional[datetime] = None
+    expiresAt: Optional[datetime] = None
+
+async def run_customers_csv(job: Job, path: str):
+    query = build_customer_query(job.shopId, **job.params)
+    with query_budget(JOBS), open(path, "w", newline="") as f:
+        job.set_progress(0, await customers_collection.count_documents(query))
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADERS)
+
+        processed = 0
+        async for customer in customers_collection.find(query).batch_size(EXPORT_BATCH_SIZE):
+            writer.writerow(customer_csv_row(customer))
+            processed += 1
+            if processed % EXPORT_BATCH_SIZE == 0:
+                job.set_progress(processed)
+        job.set_progress(processed)
+
+async def run_dashboard_report(job: Job, path: str):
+    start, end = parse_date_range(job.params.get("start_date"), job.params.get("end_date"))
+    with query_budget(JOBS):
+        data = await build_dashboard_data(job.shopId, start, end, on_progress=job.set_progress)
+    with open(path, "w") as f:
+        json.dump(data, f, default=str)
+
+async def run_loan_accrual(job: Job, path: str):
+    accrual_date = job.params.get("accrual_date") or datetime.utcnow().strftime("%Y-%m-%d")
+    rules = AccrualRules(**job.params["rules"])
+    with query_budget(JOBS):
+        summary = await accrue_late_fees(job.shopId, accrual_date, rules, on_progress=job.set_progress)
+    with open(path, "w") as f:
+        json.dump(summary, f, default=str)
+
+JOB_TYPES = {
+    "customers_csv": (run_customers_csv, "customers.csv", "text/csv"),
+    "dashboard_report": (run_dashboard_report, "dashboard.json", "application/json"),
+    "loan_accrual": (run_loan_accrual, "accrual.json", "application/json"),
+}
+
+JOB_PARAMS = {
+    "customers_csv": CustomersCsvParams,
+    "dashboard_report": DashboardReportParams,
+    "loan_accrual": LoanAccrualParams,
+}
+
+# Job types that must not run concurrently for the same shop
+EXCLUSIVE_JOB_TYPES = {"loan_accrual"}
+
+def job_status(job: dict) -> JobStatus:
+    return JobStatus(id=job["_id"], **job)
+
+async def get_job_or_404(id: str, shop_id: str) -> dict:
+    job = await job_runner.get(id, shop_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/", response_model=JobStatus, status_code=202)
+async def create_job(job_create: JobCreate, shop_id: str = Depends(get_shop_id)):
+    # Validate parameters up front so bad requests fail fast instead of inside the job
+    try:
+        params = JOB_PARAMS[job_create.type].parse_obj(job_create.params).dict()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid job parameters: {str(e)}")
+
+    if job_create.type == "customers_csv":
+        build_customer_query(shop_id, **params)
+    elif job_create.type == "dashboard_report":
+        parse_date_range(params["start_date"], params["end_date"])
+    else:
+        if params["accrual_date"]:
+            try:
+                datetime.strptime(params["accrual_date"], "%Y-%m-%d")
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+        if not AccrualRules(**params["rules"]).charges_fee():
+            raise HTTPException(status_code=400, detail="Accrual rules must set flatPerDay or percentPerMonth")
+
+    handler, filename, media_type = JOB_TYPES[job_create.type]
+    try:
+        job = await job_runner.submit(
+            shop_id, job_create.type, handler, params, filename, media_type,
+            exclusive=job_create.type in EXCLUSIVE_JOB_TYPES
+        )
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except JobAlreadyRunning as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return job_status(job.to_doc())
+
+@router.get("/{id}", response_model=JobStatus)
+async def get_job(id: str, shop_id: str = Depends(get_shop_id)):
+    return job_status(await get_job_or_404(id, shop_id))
+
+@router.get("/{id}/result")
+async def get_job_result(id: str, shop_id: str = Depends(get_shop_id)):
+    job = await get_job_or_404(id, shop_id)
+    if job["status"] != COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    # The TTL monitor removes expired documents lazily, so check expiry and the file directly
+    if job["expiresAt"] <= datetime.utcnow() or not os.path.exists(job["resultPath"]):
+        raise HTTPException(status_code=404, detail="Job result has expired")
+    return FileResponse(job["resultPath"], media_type=job["mediaType"], filename=job["filename"])
+
+@router.delete("/{id}", response_model=JobStatus)
+async def cancel_job(id: str, shop_id: str = Depends(get_shop_id)):
+    job = await get_job_or_404(id, shop_id)
+    if job["status"] not in ACTIVE_STATES:
+        raise HTTPException(status_code=400, detail=f"Job already {job['status']}")
+    cancelled = await job_runner.cancel(id, shop_id)
+    if not cancelled:
+        job = await get_job_or_404(id, shop_id)
+        raise HTTPException(status_code=400, detail=f"Job already {job['status']}")
+    return job_status(cancelled)
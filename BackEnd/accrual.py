@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import re
+from datetime import datetime
+from typing import Callable, Optional
+import numpy as np
+from dotenv import load_dotenv
+from pydantic import BaseModel, Field
+from pymongo import UpdateOne
+from database import loans_collection
+
+load_dotenv()
+
+ACCRUAL_CHUNK_SIZE = int(os.getenv("ACCRUAL_CHUNK_SIZE", "10000"))
+
+DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+def optional_env_float(name: str) -> Optional[float]:
+    value = os.getenv(name)
+    return float(value) if value else None
+
+class AccrualRules(BaseModel):
+    flatPerDay: float = Field(float(os.getenv("LATE_FEE_FLAT_PER_DAY", "0")), ge=0)
+    percentPerMonth: float = Field(float(os.getenv("LATE_FEE_PERCENT_PER_MONTH", "0")), ge=0)
+    graceDays: int = Field(int(os.getenv("LATE_FEE_GRACE_DAYS", "0")), ge=0)
+    maxFee: Optional[float] = Field(optional_env_float("LATE_FEE_MAX"), ge=0)
+    maxFeePercent: Optional[float] = Field(optional_env_float("LATE_FEE_MAX_PERCENT"), ge=0)
+
+    class Config:
+        extra = "forbid"
+
+    def charges_fee(self) -> bool:
+        return self.flatPerDay > 0 or self.percentPerMonth > 0
+
+def compute_fees(amounts: np.ndarray, days_overdue: np.ndarray, rules: AccrualRules) -> np.ndarray:
+    # Total fee accrued as of the accrual date; a month is counted as 30 days
+    days = np.maximum(days_overdue - rules.graceDays, 0)
+    fees = rules.flatPerDay * days + amounts * (rules.percentPerMonth / 100) * (days / 30)
+    if rules.maxFee is not None:
+        fees = np.minimum(fees, rules.maxFee)
+    if rules.maxFeePercent is not None:
+        fees = np.minimum(fees, amounts * (rules.maxFeePercent / 100))
+    return np.round(fees, 2)
+
+def rules_key(rules: AccrualRules) -> str:
+    return hashlib.sha1(json.dumps(rules.dict(), sort_keys=True).encode()).hexdigest()[:16]
+
+def parse_due_dates(values: list) -> np.ndarray:
+    # Rows that are not exact YYYY-MM-DD dates become NaT so the caller can skip them
+    # instead of failing the whole run
+    dates = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[D]")
+    well_formed = np.array(
+        [isinstance(value, str) and DATE_PATTERN.match(value) is not None for value in values], dtype=bool
+    )
+    try:
+        dates[well_formed] = np.array(
+            [value for value, ok in zip(values, well_formed) if ok], dtype="datetime64[D]"
+        )
+    except ValueError:
+        # Well-formed but impossible dates such as 2024-02-30
+        for i in np.flatnonzero(well_formed):
+            try:
+                dates[i] = np.datetime64(values[i], "D")
+            except ValueError:
+                pass
+    return dates
+
+async def customer_accrued_fees(shop_id: str, customer_ids: list) -> dict:
+    # Balances are derived from the unpaid loans on read rather than stored on the customer,
+    # so accrual runs and payments never have to keep a denormalized total in step
+    return {
+        row["_id"]: round(row["total"], 2)
+        async for row in loans_collection.aggregate([
+            {"$match": {"shopId": shop_id, "customerId": {"$in": customer_ids}, "status": "unpaid"}},
+            {"$group": {"_id": "$customerId", "total": {"$sum": "$accruedFee"}}}
+        ])
+    }
+
+async def accrue_late_fees(
+    shop_id: str,
+    accrual_date: str,
+    rules: AccrualRules,
+    on_progress: Optional[Callable[[int, Optional[int]], None]] = None
+) -> dict:
+    as_of = np.datetime64(datetime.strptime(accrual_date, "%Y-%m-%d").date(), "D")
+    key = rules_key(rules)
+
+    # Loans already accrued for this date with the same rules, or for a later date, are skipped.
+    # Re-running a date is a no-op, re-running it with corrected rules recomputes it, and an
+    # older date never overwrites newer fees
+    not_accrued = {"$or": [
+        {"accrualDate": {"$exists": False}},
+        {"accrualDate": {"$lt": accrual_date}},
+        {"accrualDate": accrual_date, "accrualRules": {"$ne": key}}
+    ]}
+    query = {
+        "shopId": shop_id,
+        "status": "unpaid",
+        "dueDate": {"$lt": accrual_date},
+        **not_accrued
+    }
+    projection = {"_id": 1, "amount": 1, "dueDate": 1}
+
+    total = await loans_collection.count_documents(query)
+    if on_progress:
+        on_progress(0, total)
+
+    processed = 0
+    accrued = 0
+    skipped = 0
+    cursor = loans_collection.find(query, projection).batch_size(ACCRUAL_CHUNK_SIZE)
+    while True:
+        chunk = await cursor.to_list(ACCRUAL_CHUNK_SIZE)
+        if not chunk:
+            break
+        processed += len(chunk)
+
+        due_dates = parse_due_dates([loan.get("dueDate") for loan in chunk])
+        valid = ~np.isnat(due_dates)
+        skipped += int((~valid).sum())
+        chunk = [loan for loan, ok in zip(chunk, valid) if ok]
+        if chunk:
+            amounts = np.array([loan["amount"] for loan in chunk], dtype=np.float64)
+            fees = compute_fees(amounts, (as_of - due_dates[valid]).astype(np.int64), rules)
+
+            result = await loans_collection.bulk_write([
+                UpdateOne(
+                    {"_id": loan["_id"], "status": "unpaid", **not_accrued},
+                    {"$set": {"accruedFee": float(fee), "accrualDate": accrual_date, "accrualRules": key}}
+                )
+                for loan, fee in zip(chunk, fees)
+            ], ordered=False)
+            accrued += result.modified_count
+
+        if on_progress:
+            on_progress(processed, total)
+
+    # Totals are read back so loans paid while the run was in progress are not counted
+    totals = await loans_collection.aggregate([
+        {"$match": {"shopId": shop_id, "status": "unpaid", "accrualDate": accrual_date, "accrualRules": key}},
+        {"$group": {"_id": None, "total": {"$sum": "$accruedFee"}}}
+    ]).to_list(1)
+    # Dates that are not YYYY-MM-DD do not compare correctly against the run date, so they
+    # are reported here rather than picked up by the query above
+    malformed = await loans_collection.count_documents({
+        "shopId": shop_id,
+        "status": "unpaid",
+        "dueDate": {"$not": DATE_PATTERN}
+    })
+
+    return {
+        "shopId": shop_id,
+        "accrualDate": accrual_date,
+        "loansAccrued": accrued,
+        "loansSkipped": skipped,
+        "malformedDueDates": malformed,
+        "totalAccrued": round(totals[0]["total"], 2) if totals else 0,
+        "rules": rules.dict()
+    }
@@ -2,37 +2,38 @@ from fastapi import APIRouter, HTTPException, Depends
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import List
 from bson import ObjectId
-from ..database import get_database
+from ..database import get_database, get_shop_id
 from ..models.category import Category, CategoryCreate, CategoryUpdate
 
 router = APIRouter(prefix="/categories", tags=["Categories"])
 
 @router.post("/", response_model=Category)
-async def create_category(category: CategoryCreate, db: AsyncIOMotorDatabase = Depends(get_database)):
+async def create_category(category: CategoryCreate, db: AsyncIOMotorDatabase = Depends(get_database), shop_id: str = Depends(get_shop_id)):
     category_dict = category.dict()
+    category_dict["shopId"] = shop_id
     category_dict["productsCount"] = 0
     category_dict["createdAt"] = datetime.utcnow()
     result = await db.categories.insert_one(category_dict)
     
-    created_category = await db.categories.find_one({"_id": result.inserted_id})
+    created_category = await db.categories.find_one({"_id": result.inserted_id, "shopId": shop_id})
     return Category(**created_category)
 
 @router.get("/", response_model=List[Category])
-async def list_categories(db: AsyncIOMotorDatabase = Depends(get_database)):
-    categories = await db.categories.find().to_list(1000)
+async def list_categories(db: AsyncIOMotorDatabase = Depends(get_database), shop_id: str = Depends(get_shop_id)):
+    categories = await db.categories.find({"shopId": shop_id}).to_list(1000)
     return [Category(**c) for c in categories]
 
 @router.get("/{id}", response_model=Category)
-async def get_category(id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+async def get_category(id: str, db: AsyncIOMotorDatabase = Depends(get_database), shop_id: str = Depends(get_shop_id)):
     if not ObjectId.is_valid(id):
         raise HTTPException(status_code=400, detail="Invalid category ID")
-    category = await db.categories.find_one({"_id": ObjectId(id)})
+    category = await db.categories.find_one({"_id": ObjectId(id), "shopId": shop_id})
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     return Category(**category)
 
 @router.put("/{id}", response_model=Category)
-async def update_category(id: str, category: CategoryUpdate, db: AsyncIOMotorDatabase = Depends(get_database)):
+async def update_category(id: str, category: CategoryUpdate, db: AsyncIOMotorDatabase = Depends(get_database), shop_id: str = Depends(get_shop_id)):
     if not ObjectId.is_valid(id):
         raise HTTPException(status_code=400, detail="Invalid category ID")
     
@@ -41,29 +42,29 @@ async def update_category(id: str, category: CategoryUpdate, db: AsyncIOMotorDat
         raise HTTPException(status_code=400, detail="No valid fields to update")
     
     result = await db.categories.update_one(
-        {"_id": ObjectId(id)},
+        {"_id": ObjectId(id), "shopId": shop_id},
         {"$set": update_dict}
     )
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Category not found or no changes made")
     
-    updated_category = await db.categories.find_one({"_id": ObjectId(id)})
+    updated_category = await db.categories.find_one({"_id": ObjectId(id), "shopId": shop_id})
     return Category(**updated_category)
 
 @router.delete("/{id}")
-async def delete_category(id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+async def delete_category(id: str, db: AsyncIOMotorDatabase = Depends(get_database), shop_id: str = Depends(get_shop_id)):
     if not ObjectId.is_valid(id):
         raise HTTPException(status_code=400, detail="Invalid category ID")
     
-    category = await db.categories.find_one({"_id": ObjectId(id)})
+    category = await db.categories.find_one({"_id": ObjectId(id), "shopId": shop_id})
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     
     # Check if category has associated products
-    product_count = await db.products.count_documents({"category": id})
+    product_count = await db.products.count_documents({"shopId": shop_id, "category": id})
     if product_count > 0:
         raise HTTPException(status_code=400, detail="Cannot delete category with associated products")
     
-    await db.categories.delete_one({"_id": ObjectId(id)})
+    await db.categories.delete_one({"_id": ObjectId(id), "shopId": shop_id})
     return {"message": "Category deleted"}
\ No newline at end of file
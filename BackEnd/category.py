@@ -19,6 +19,7 @@ class CategoryUpdate(CategoryBase):
 
 class Category(CategoryBase):
     id: str = Field(..., alias="_id")
+    shopId: Optional[str] = None
     productsCount: int
     createdAt: datetime
 
@@ -31,10 +31,12 @@ class CustomerUpdate(CustomerBase):
 
 class Customer(CustomerBase):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    shopId: Optional[str] = None
     createdAt: datetime
     totalLoans: int
     unpaidLoans: int
     lastLoanDate: Optional[str] = None
+    accruedFees: float = 0  # Computed from the customer's unpaid loans when read
 
     class Config:
         arbitrary_types_allowed = True
@@ -1,14 +1,98 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi import Header, HTTPException
+from pymongo import ASCENDING
 from dotenv import load_dotenv
+from typing import Optional
+import json
 import os
+import re
 
 load_dotenv()
 
 MONGODB_URI = os.getenv("MONGODB_URI")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "product_management")
+# "single": one shop per deployment and database, as before tenancy; every request belongs to SINGLE_SHOP_ID.
+# "multi": shops share the deployment and each caller is mapped to its shop by its API key.
+TENANCY_MODE = os.getenv("TENANCY_MODE", "single")
+SINGLE_SHOP_ID = os.getenv("SINGLE_SHOP_ID", "default")
+# JSON object mapping API keys to shop IDs, e.g. {"<api key>": "shop-1"}
+SHOP_API_KEYS = json.loads(os.getenv("SHOP_API_KEYS", "{}"))
+
+SHOP_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
 
 client = AsyncIOMotorClient(MONGODB_URI)
 db = client[DATABASE_NAME]
 
 customers_collection = db.get_collection("customers")
-loans_collection = db.get_collection("loans")
\ No newline at end of file
+loans_collection = db.get_collection("loans")
+products_collection = db.get_collection("products")
+categories_collection = db.get_collection("categories")
+jobs_collection = db.get_collection("jobs")
+dashboard_generations_collection = db.get_collection("dashboard_generations")
+
+# Every index is led by shopId so tenant-scoped queries never scan other shops' documents
+INDEXES = [
+    (customers_collection, [
+        [("shopId", ASCENDING), ("createdAt", ASCENDING)],
+        [("shopId", ASCENDING), ("unpaidLoans", ASCENDING)],
+        [("shopId", ASCENDING), ("mobileNumber", ASCENDING)],
+    ]),
+    (loans_collection, [
+        [("shopId", ASCENDING), ("customerId", ASCENDING), ("status", ASCENDING)],
+        [("shopId", ASCENDING), ("status", ASCENDING), ("dueDate", ASCENDING)],
+        [("shopId", ASCENDING), ("status", ASCENDING), ("paymentDate", ASCENDING)],
+        [("shopId", ASCENDING), ("loanDate", ASCENDING)],
+    ]),
+    (products_collection, [
+        [("shopId", ASCENDING), ("category", ASCENDING)],
+    ]),
+    (categories_collection, [
+        [("shopId", ASCENDING), ("name", ASCENDING)],
+    ]),
+]
+
+def get_database():
+    return db
+
+def check_tenancy_config():
+    if TENANCY_MODE not in ("single", "multi"):
+        raise RuntimeError(f"TENANCY_MODE must be 'single' or 'multi', got {TENANCY_MODE!r}")
+    if TENANCY_MODE == "single":
+        shop_ids = [SINGLE_SHOP_ID]
+    else:
+        if not isinstance(SHOP_API_KEYS, dict) or not SHOP_API_KEYS:
+            raise RuntimeError("TENANCY_MODE=multi requires SHOP_API_KEYS to map API keys to shop IDs")
+        shop_ids = list(SHOP_API_KEYS.values())
+    for shop_id in shop_ids:
+        if not isinstance(shop_id, str) or not SHOP_ID_PATTERN.match(shop_id):
+            raise RuntimeError(f"Invalid shop ID {shop_id!r}")
+
+async def get_shop_id(x_api_key: Optional[str] = Header(None)) -> str:
+    # The shop is always derived server-side, never taken from the client
+    if TENANCY_MODE == "single":
+        return SINGLE_SHOP_ID
+    shop_id = SHOP_API_KEYS.get(x_api_key) if x_api_key else None
+    if not shop_id:
+        raise HTTPException(status_code=401, detail="Invalid or missing API key")
+    return shop_id
+
+async def ensure_indexes():
+    for collection, indexes in INDEXES:
+        for keys in indexes:
+            await collection.create_index(keys)
+
+    await jobs_collection.create_index([("shopId", ASCENDING), ("status", ASCENDING)])
+    await jobs_collection.create_index([("status", ASCENDING), ("heartbeatAt", ASCENDING)])
+    # Finished jobs are removed once their result expires
+    await jobs_collection.create_index("expiresAt", expireAfterSeconds=0)
+    # Only jobs that must not run twice for a shop carry a lockKey
+    await jobs_collection.create_index(
+        "lockKey", unique=True, partialFilterExpression={"lockKey": {"$exists": True}}
+    )
+
+async def assign_default_shop():
+    # Adopt documents written before tenancy into the deployment's shop
+    if TENANCY_MODE != "single":
+        return
+    for collection, _ in INDEXES:
+        await collection.update_many({"shopId": {"$exists": False}}, {"$set": {"shopId": SINGLE_SHOP_ID}})
@@ -0,0 +1,266 @@
+import asyncio
+import contextvars
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+from dotenv import load_dotenv
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from database import jobs_collection
+
+load_dotenv()
+
+# Job metadata lives in the jobs collection so every uvicorn worker sees the same jobs.
+# Result files are written to JOBS_DIR, which must be shared by all workers.
+JOBS_DIR = os.getenv("JOBS_DIR", "job_results")
+# Jobs executing at once in each worker process
+JOBS_MAX_WORKERS = int(os.getenv("JOBS_MAX_WORKERS", "2"))
+# Pending and running jobs allowed across all workers, and for any single shop
+JOBS_MAX_ACTIVE = int(os.getenv("JOBS_MAX_ACTIVE", "20"))
+JOBS_MAX_ACTIVE_PER_SHOP = int(os.getenv("JOBS_MAX_ACTIVE_PER_SHOP", "3"))
+JOBS_RESULT_TTL_MINUTES = int(os.getenv("JOBS_RESULT_TTL_MINUTES", "60"))
+JOBS_CLEANUP_INTERVAL_SECONDS = int(os.getenv("JOBS_CLEANUP_INTERVAL_SECONDS", "60"))
+JOBS_HEARTBEAT_SECONDS = int(os.getenv("JOBS_HEARTBEAT_SECONDS", "5"))
+# Active jobs whose worker has not sent a heartbeat for this long are marked failed
+JOBS_STALE_SECONDS = int(os.getenv("JOBS_STALE_SECONDS", "60"))
+
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+ACTIVE_STATES = [PENDING, RUNNING]
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+class JobQueueFull(Exception):
+    pass
+
+class JobAlreadyRunning(Exception):
+    pass
+
+class Job:
+    def __init__(self, shop_id: str, job_type: str, params: Dict[str, Any], filename: str, media_type: str):
+        self.id = uuid.uuid4().hex
+        self.shopId = shop_id
+        self.type = job_type
+        self.params = params
+        self.filename = filename
+        self.mediaType = media_type
+        self.status = PENDING
+        self.processed = 0
+        self.total: Optional[int] = None
+        self.error: Optional[str] = None
+        self.createdAt = datetime.utcnow()
+        self.startedAt: Optional[datetime] = None
+        self.finishedAt: Optional[datetime] = None
+        self.expiresAt: Optional[datetime] = None
+        self.resultPath: Optional[str] = None
+
+    def set_progress(self, processed: int, total: Optional[int] = None):
+        self.processed = processed
+        if total is not None:
+            self.total = total
+
+    def to_doc(self) -> dict:
+        return {
+            "_id": self.id,
+            "shopId": self.shopId,
+            "type": self.type,
+            "params": self.params,
+            "filename": self.filename,
+            "mediaType": self.mediaType,
+            "status": self.status,
+            "processed": self.processed,
+            "total": self.total,
+            "error": self.error,
+            "createdAt": self.createdAt,
+            "startedAt": self.startedAt,
+            "finishedAt": self.finishedAt,
+            "expiresAt": self.expiresAt,
+            "resultPath": self.resultPath,
+            "heartbeatAt": datetime.utcnow(),
+        }
+
+# A handler receives the job (to report progress) and the path it must write its result to
+JobHandler = Callable[[Job, str], Awaitable[None]]
+
+class JobRunner:
+    def __init__(
+        self,
+        results_dir: str = JOBS_DIR,
+        max_workers: int = JOBS_MAX_WORKERS,
+        max_active: int = JOBS_MAX_ACTIVE,
+        max_active_per_shop: int = JOBS_MAX_ACTIVE_PER_SHOP,
+        result_ttl: timedelta = timedelta(minutes=JOBS_RESULT_TTL_MINUTES)
+    ):
+        self.results_dir = results_dir
+        self.max_workers = max_workers
+        self.max_active = max_active
+        self.max_active_per_shop = max_active_per_shop
+        self.result_ttl = result_ttl
+        # Jobs owned by this worker process
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._cleanup_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        os.makedirs(self.results_dir, exist_ok=True)
+        self.purge_orphaned_files()
+        self._semaphore = asyncio.Semaphore(self.max_workers)
+        self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def stop(self):
+        if self._cleanup_task:
+            self._cleanup_task.cancel()
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+    async def submit(
+        self,
+        shop_id: str,
+        job_type: str,
+        handler: JobHandler,
+        params: Dict[str, Any],
+        filename: str,
+        media_type: str,
+        exclusive: bool = False
+    ) -> Job:
+        if self._semaphore is None:
+            raise RuntimeError("Job runner has not been started")
+
+        # The limits are checked before inserting, so concurrent submissions may overshoot them slightly
+        active = {"status": {"$in": ACTIVE_STATES}}
+        if await jobs_collection.count_documents({"shopId": shop_id, **active}) >= self.max_active_per_shop:
+            raise JobQueueFull("Too many jobs in progress for this shop")
+        if await jobs_collection.count_documents(active) >= self.max_active:
+            raise JobQueueFull("Too many jobs in progress")
+
+        job = Job(shop_id, job_type, params, filename, media_type)
+        doc = job.to_doc()
+        if exclusive:
+            # A unique index on lockKey allows one active job of this type per shop across workers
+            doc["lockKey"] = f"{shop_id}:{job_type}"
+        try:
+            await jobs_collection.insert_one(doc)
+        except DuplicateKeyError:
+            raise JobAlreadyRunning(f"A {job_type} job is already running for this shop")
+
+        # Run in a fresh context so the job does not inherit the submitting request's state
+        self._tasks[job.id] = contextvars.Context().run(asyncio.create_task, self._run(job, handler))
+        return job
+
+    async def get(self, job_id: str, shop_id: str) -> Optional[dict]:
+        return await jobs_collection.find_one({"_id": job_id, "shopId": shop_id})
+
+    async def cancel(self, job_id: str, shop_id: str) -> Optional[dict]:
+        # The worker that owns the job picks up cancelRequested on its next heartbeat
+        job = await jobs_collection.find_one_and_update(
+            {"_id": job_id, "shopId": shop_id, "status": {"$in": ACTIVE_STATES}},
+            {"$set": {"cancelRequested": True}}
+        )
+        task = self._tasks.get(job_id)
+        if job and task:
+            task.cancel()
+        return job
+
+    async def _run(self, job: Job, handler: JobHandler):
+        tmp_path = os.path.join(self.results_dir, f"{job.id}.part")
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            async with self._semaphore:
+                job.status = RUNNING
+                job.startedAt = datetime.utcnow()
+                await jobs_collection.update_one(
+                    {"_id": job.id},
+                    {"$set": {"status": job.status, "startedAt": job.startedAt}}
+                )
+                await handler(job, tmp_path)
+            job.resultPath = os.path.join(self.results_dir, job.id)
+            os.replace(tmp_path, job.resultPath)
+            job.status = COMPLETED
+        except asyncio.CancelledError:
+            job.status = CANCELLED
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+        finally:
+            heartbeat.cancel()
+            job.finishedAt = datetime.utcnow()
+            job.expiresAt = job.finishedAt + self.result_ttl
+            self._tasks.pop(job.id, None)
+            if job.status != COMPLETED and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            await jobs_collection.update_one({"_id": job.id}, {
+                "$set": {
+                    "status": job.status,
+                    "processed": job.processed,
+                    "total": job.total,
+                    "error": job.error,
+                    "finishedAt": job.finishedAt,
+                    "expiresAt": job.expiresAt,
+                    "resultPath": job.resultPath,
+                },
+                "$unset": {"lockKey": ""}
+            })
+
+    async def _heartbeat(self, job: Job):
+        while True:
+            await asyncio.sleep(JOBS_HEARTBEAT_SECONDS)
+            try:
+                doc = await jobs_collection.find_one_and_update(
+                    {"_id": job.id},
+                    {"$set": {"processed": job.processed, "total": job.total, "heartbeatAt": datetime.utcnow()}},
+                    projection={"cancelRequested": 1}
+                )
+            except PyMongoError:
+                continue
+            if doc and doc.get("cancelRequested") and job.id in self._tasks:
+                self._tasks[job.id].cancel()
+
+    async def fail_stale_jobs(self):
+        # Jobs whose worker died mid-run would otherwise stay active and hold their lockKey
+        now = datetime.utcnow()
+        await jobs_collection.update_many(
+            {
+                "status": {"$in": ACTIVE_STATES},
+                "heartbeatAt": {"$lt": now - timedelta(seconds=JOBS_STALE_SECONDS)}
+            },
+            {
+                "$set": {
+                    "status": FAILED,
+                    "error": "Job was lost by its worker",
+                    "finishedAt": now,
+                    "expiresAt": now + self.result_ttl
+                },
+                "$unset": {"lockKey": ""}
+            }
+        )
+
+    def purge_orphaned_files(self):
+        # Finished job documents expire through the TTL index on expiresAt; their result files,
+        # and .part files left by dead workers, are aged out here by mtime
+        cutoff = time.time() - self.result_ttl.total_seconds()
+        for entry in os.scandir(self.results_dir):
+            job_id = entry.name[:-len(".part")] if entry.name.endswith(".part") else entry.name
+            if job_id in self._tasks or not entry.is_file():
+                continue
+            try:
+                if entry.stat().st_mtime <= cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    async def _cleanup_loop(self):
+        while True:
+            await asyncio.sleep(JOBS_CLEANUP_INTERVAL_SECONDS)
+            try:
+                await self.fail_stale_jobs()
+            except PyMongoError:
+                pass
+            self.purge_orphaned_files()
+
+job_runner = JobRunner()
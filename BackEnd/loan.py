@@ -13,7 +13,9 @@ class LoanBase(BaseModel):
     status: str = "unpaid"
 
 class LoanCreate(LoanBase):
-    pass
+    # Dates are stored as YYYY-MM-DD strings and compared as strings in queries
+    loanDate: str = Field(..., regex=r"^\d{4}-\d{2}-\d{2}$")
+    dueDate: str = Field(..., regex=r"^\d{4}-\d{2}-\d{2}$")
 
 class LoanUpdate(BaseModel):
     status: Optional[str] = None
@@ -21,7 +23,11 @@ class LoanUpdate(BaseModel):
 
 class Loan(LoanBase):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    shopId: Optional[str] = None
     paymentDate: Optional[str] = None
+    accruedFee: float = 0
+    paidFee: float = 0
+    accrualDate: Optional[str] = None
 
     class Config:
         arbitrary_types_allowed = True
@@ -4,14 +4,22 @@ from routes.customers.CustomerAdd import router as customer_add_router
 from routes.customers.CustomerDetail import router as customer_detail_router
 from routes.customers.CustomerList import router as customer_list_router
 from routes.dashboard.Dashboard import router as dashboard_router
+from routes.jobs.Jobs import router as jobs_router
+from job_runner import job_runner
+from query_limits import QueryLimitsMiddleware, get_limit_stats
+from database import check_tenancy_config, ensure_indexes, assign_default_shop
 import motor.motor_asyncio
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
+check_tenancy_config()
 
 app = FastAPI(title="Customer Management API")
 
+# Query time budgets and admission control (added first so CORS headers wrap its responses)
+app.add_middleware(QueryLimitsMiddleware)
+
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
@@ -32,16 +40,25 @@ app.include_router(customer_add_router, prefix="/customers", tags=["CustomerAdd"
 app.include_router(customer_detail_router, prefix="/customers", tags=["CustomerDetail"])
 app.include_router(customer_list_router, prefix="/customers", tags=["CustomerList"])
 app.include_router(dashboard_router, prefix="/dashboard", tags=["Dashboard"])
+app.include_router(jobs_router, prefix="/jobs", tags=["Jobs"])
 
 @app.on_event("startup")
 async def startup_db_client():
     app.mongodb_client = client
     app.mongodb = db
+    await ensure_indexes()
+    await assign_default_shop()
+    await job_runner.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await job_runner.stop()
     app.mongodb_client.close()
 
 @app.get("/")
 async def root():
-    return {"message": "Customer Management API"}
\ No newline at end of file
+    return {"message": "Customer Management API"}
+
+@app.get("/metrics/limits")
+async def limit_stats():
+    return get_limit_stats()
\ No newline at end of file
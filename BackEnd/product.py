@@ -30,6 +30,7 @@ class ProductUpdate(ProductBase):
 
 class Product(ProductBase):
     id: str = Field(..., alias="_id")
+    shopId: Optional[str] = None
     createdAt: datetime
 
     class Config:
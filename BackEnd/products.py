@@ -2,48 +2,49 @@ from fastapi import APIRouter, HTTPException, Depends
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import List
 from bson import ObjectId
-from ..database import get_database
+from ..database import get_database, get_shop_id
 from ..models.product import Product, ProductCreate, ProductUpdate
 from ..models.category import Category
 
 router = APIRouter(prefix="/products", tags=["Products"])
 
 @router.post("/", response_model=Product)
-async def create_product(product: ProductCreate, db: AsyncIOMotorDatabase = Depends(get_database)):
+async def create_product(product: ProductCreate, db: AsyncIOMotorDatabase = Depends(get_database), shop_id: str = Depends(get_shop_id)):
     # Verify category exists
-    category = await db.categories.find_one({"_id": ObjectId(product.category)})
+    category = await db.categories.find_one({"_id": ObjectId(product.category), "shopId": shop_id})
     if not category:
         raise HTTPException(status_code=400, detail="Invalid category ID")
     
     product_dict = product.dict()
+    product_dict["shopId"] = shop_id
     product_dict["createdAt"] = datetime.utcnow()
     result = await db.products.insert_one(product_dict)
     
     # Update category productsCount
     await db.categories.update_one(
-        {"_id": ObjectId(product.category)},
+        {"_id": ObjectId(product.category), "shopId": shop_id},
         {"$inc": {"productsCount": 1}}
     )
     
-    created_product = await db.products.find_one({"_id": result.inserted_id})
+    created_product = await db.products.find_one({"_id": result.inserted_id, "shopId": shop_id})
     return Product(**created_product)
 
 @router.get("/", response_model=List[Product])
-async def list_products(db: AsyncIOMotorDatabase = Depends(get_database)):
-    products = await db.products.find().to_list(1000)
+async def list_products(db: AsyncIOMotorDatabase = Depends(get_database), shop_id: str = Depends(get_shop_id)):
+    products = await db.products.find({"shopId": shop_id}).to_list(1000)
     return [Product(**p) for p in products]
 
 @router.get("/{id}", response_model=Product)
-async def get_product(id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+async def get_product(id: str, db: AsyncIOMotorDatabase = Depends(get_database), shop_id: str = Depends(get_shop_id)):
     if not ObjectId.is_valid(id):
         raise HTTPException(status_code=400, detail="Invalid product ID")
-    product = await db.products.find_one({"_id": ObjectId(id)})
+    product = await db.products.find_one({"_id": ObjectId(id), "shopId": shop_id})
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     return Product(**product)
 
 @router.put("/{id}", response_model=Product)
-async def update_product(id: str, product: ProductUpdate, db: AsyncIOMotorDatabase = Depends(get_database)):
+async def update_product(id: str, product: ProductUpdate, db: AsyncIOMotorDatabase = Depends(get_database), shop_id: str = Depends(get_shop_id)):
     if not ObjectId.is_valid(id):
         raise HTTPException(status_code=400, detail="Invalid product ID")
     
@@ -53,47 +54,47 @@ async def update_product(id: str, product: ProductUpdate, db: AsyncIOMotorDataba
     
     # Verify category exists if provided
     if "category" in update_dict:
-        category = await db.categories.find_one({"_id": ObjectId(update_dict["category"])})
+        category = await db.categories.find_one({"_id": ObjectId(update_dict["category"]), "shopId": shop_id})
         if not category:
             raise HTTPException(status_code=400, detail="Invalid category ID")
         
         # Update productsCount if category changes
-        existing_product = await db.products.find_one({"_id": ObjectId(id)})
+        existing_product = await db.products.find_one({"_id": ObjectId(id), "shopId": shop_id})
         if existing_product and existing_product["category"] != update_dict["category"]:
             await db.categories.update_one(
-                {"_id": ObjectId(existing_product["category"])},
+                {"_id": ObjectId(existing_product["category"]), "shopId": shop_id},
                 {"$inc": {"productsCount": -1}}
             )
             await db.categories.update_one(
-                {"_id": ObjectId(update_dict["category"])},
+                {"_id": ObjectId(update_dict["category"]), "shopId": shop_id},
                 {"$inc": {"productsCount": 1}}
             )
     
     result = await db.products.update_one(
-        {"_id": ObjectId(id)},
+        {"_id": ObjectId(id), "shopId": shop_id},
         {"$set": update_dict}
     )
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Product not found or no changes made")
     
-    updated_product = await db.products.find_one({"_id": ObjectId(id)})
+    updated_product = await db.products.find_one({"_id": ObjectId(id), "shopId": shop_id})
     return Product(**updated_product)
 
 @router.delete("/{id}")
-async def delete_product(id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+async def delete_product(id: str, db: AsyncIOMotorDatabase = Depends(get_database), shop_id: str = Depends(get_shop_id)):
     if not ObjectId.is_valid(id):
         raise HTTPException(status_code=400, detail="Invalid product ID")
     
-    product = await db.products.find_one({"_id": ObjectId(id)})
+    product = await db.products.find_one({"_id": ObjectId(id), "shopId": shop_id})
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    await db.products.delete_one({"_id": ObjectId(id)})
+    await db.products.delete_one({"_id": ObjectId(id), "shopId": shop_id})
     
     # Update category productsCount
     await db.categories.update_one(
-        {"_id": ObjectId(product["category"])},
+        {"_id": ObjectId(product["category"]), "shopId": shop_id},
         {"$inc": {"productsCount": -1}}
     )
     
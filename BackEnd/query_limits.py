@@ -0,0 +1,169 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+from urllib.parse import parse_qs
+from dotenv import load_dotenv
+from fastapi.responses import JSONResponse
+from pymongo import timeout as mongo_timeout
+from pymongo.errors import PyMongoError
+
+load_dotenv()
+
+DEFAULT = "default"
+DASHBOARD = "dashboard"
+EXPORT = "export"
+SEARCH = "search"
+JOBS = "jobs"
+
+# Time budget in milliseconds applied to every Mongo operation made while serving a route
+QUERY_BUDGETS_MS = {
+    DEFAULT: int(os.getenv("QUERY_BUDGET_MS_DEFAULT", "5000")),
+    DASHBOARD: int(os.getenv("QUERY_BUDGET_MS_DASHBOARD", "10000")),
+    EXPORT: int(os.getenv("QUERY_BUDGET_MS_EXPORT", "30000")),
+    SEARCH: int(os.getenv("QUERY_BUDGET_MS_SEARCH", "3000")),
+    JOBS: int(os.getenv("QUERY_BUDGET_MS_JOBS", "600000")),
+}
+
+# (concurrent requests, queued requests) allowed on each heavy route
+ADMISSION_LIMITS = {
+    DASHBOARD: (int(os.getenv("CONCURRENCY_DASHBOARD", "4")), int(os.getenv("QUEUE_DASHBOARD", "8"))),
+    EXPORT: (int(os.getenv("CONCURRENCY_EXPORT", "2")), int(os.getenv("QUEUE_EXPORT", "2"))),
+    SEARCH: (int(os.getenv("CONCURRENCY_SEARCH", "8")), int(os.getenv("QUEUE_SEARCH", "16"))),
+}
+
+ADMISSION_WAIT_SECONDS = float(os.getenv("ADMISSION_WAIT_SECONDS", "5"))
+RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", "5"))
+
+stats: Dict[str, Dict[str, int]] = {
+    route: {"rejections": 0, "timeouts": 0} for route in QUERY_BUDGETS_MS
+}
+
+class AdmissionRejected(Exception):
+    pass
+
+class AdmissionLimiter:
+    def __init__(self, concurrency: int, max_queue: int):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.waiting = 0
+        self.active = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @asynccontextmanager
+    async def admit(self):
+        # Created lazily so the semaphore belongs to the server's event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+        elif self.waiting >= self.max_queue:
+            raise AdmissionRejected()
+        else:
+            self.waiting += 1
+            acquired = False
+            try:
+                async with asyncio.timeout(ADMISSION_WAIT_SECONDS):
+                    await self._semaphore.acquire()
+                    acquired = True
+            except TimeoutError:
+                # The permit may have been granted just as the timeout fired
+                if acquired:
+                    self._semaphore.release()
+                raise AdmissionRejected()
+            except asyncio.CancelledError:
+                if acquired:
+                    self._semaphore.release()
+                raise
+            finally:
+                self.waiting -= 1
+
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+limiters = {
+    route: AdmissionLimiter(concurrency, max_queue)
+    for route, (concurrency, max_queue) in ADMISSION_LIMITS.items()
+}
+
+def budget_seconds(route: str) -> float:
+    return QUERY_BUDGETS_MS.get(route, QUERY_BUDGETS_MS[DEFAULT]) / 1000
+
+@contextmanager
+def query_budget(route: str):
+    try:
+        with mongo_timeout(budget_seconds(route)):
+            yield
+    except PyMongoError as e:
+        if e.timeout:
+            stats[route]["timeouts"] += 1
+        raise
+
+def resolve_route(method: str, path: str, query_string: bytes) -> str:
+    path = path.rstrip("/")
+    if path == "/dashboard" or path.startswith("/dashboard/"):
+        return DASHBOARD
+    if path == "/customers/export/csv":
+        return EXPORT
+    if method == "GET" and path == "/customers" and parse_qs(query_string.decode()).get("search"):
+        return SEARCH
+    return DEFAULT
+
+def is_timeout(e: Exception) -> bool:
+    return isinstance(e, PyMongoError) and e.timeout
+
+def raise_if_timeout(e: Exception):
+    # Lets budget overruns reach the middleware instead of being reported as a generic 500
+    if is_timeout(e):
+        raise e
+
+def get_limit_stats() -> dict:
+    return {
+        route: {
+            **counters,
+            "budgetMs": QUERY_BUDGETS_MS[route],
+            "active": limiters[route].active if route in limiters else 0,
+            "queued": limiters[route].waiting if route in limiters else 0,
+        }
+        for route, counters in stats.items()
+    }
+
+class QueryLimitsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = resolve_route(scope["method"], scope["path"], scope.get("query_string", b""))
+        limiter = limiters.get(route)
+        try:
+            if limiter:
+                async with limiter.admit():
+                    await self._call_with_budget(route, scope, receive, send)
+            else:
+                await self._call_with_budget(route, scope, receive, send)
+        except AdmissionRejected:
+            stats[route]["rejections"] += 1
+            response = JSONResponse(
+                {"detail": "Server is busy, please retry later"},
+                status_code=503,
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+            )
+            await response(scope, receive, send)
+
+    async def _call_with_budget(self, route, scope, receive, send):
+        try:
+            with query_budget(route):
+                await self.app(scope, receive, send)
+        except PyMongoError as e:
+            if not e.timeout:
+                raise
+            response = JSONResponse({"detail": "Query time budget exceeded"}, status_code=504)
+            await response(scope, receive, send)